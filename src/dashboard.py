@@ -2,38 +2,155 @@ import streamlit as st
 import pandas as pd
 import plotly.graph_objects as go
 import os
+import logging
+from collections import OrderedDict
 
 # --- IMPORT THE AGENT DIRECTLY (Monolith Architecture) ---
 try:
     from src.main import app
+    from src.tools.market_data import FETCH_ERRORS, clear_market_data_cache, get_price_history, get_current_price
+    from src.tools.charts import downsample_ohlc
 except ImportError:
     import sys
     sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
     from src.main import app
+    from src.tools.market_data import FETCH_ERRORS, clear_market_data_cache, get_price_history, get_current_price
+    from src.tools.charts import downsample_ohlc
+
+logger = logging.getLogger(__name__)
 
 # --- 1. CONFIGURATION ---
 st.set_page_config(page_title="Equity Research", layout="wide")
 st.title("🤖 AI Equity Research Agent")
 
+MAX_CACHED_RESULTS = 16  # per-session LRU of finished analyses
+if "results" not in st.session_state:
+    st.session_state.results = OrderedDict()
+
+class PipelineError(Exception):
+    """Raised by run_pipeline when a tool failed, carrying the partial final state."""
+
+    def __init__(self, final_state: dict):
+        super().__init__("; ".join(final_state["errors"]))
+        self.final_state = final_state
+
+@st.cache_data(ttl=300, show_spinner=False)
+def run_pipeline(ticker: str, max_revisions: int) -> dict:
+    """
+    Runs the agent graph once per (ticker, max_revisions) and memoizes the result.
+    The price history is dropped from the cached state; the chart reads it from
+    the market data history cache instead. Runs that recorded errors raise
+    PipelineError, which Streamlit does not cache.
+    """
+    initial_state = {
+        "ticker": ticker, 
+        "max_revisions": max_revisions,
+        "revision_count": 0
+    }
+    final_state = app.invoke(initial_state)
+    final_state.pop("price_history", None)
+    if final_state.get("errors"):
+        raise PipelineError(final_state)
+    return final_state
+
+def build_snapshot(ticker: str, final_state: dict) -> dict:
+    """Derives the headline metric values (price, technical signal) from a finished run."""
+    market_data = final_state.get("market_data", {})
+    technicals = final_state.get("technicals", {})
+    return {
+        "ticker": ticker,
+        "price": market_data.get("current_price", "N/A"),
+        "signal": technicals.get('overall_signal', {}).get('signal', 'Neutral'),
+    }
+
+@st.fragment(run_every="30s")
+def price_fragment(snapshot: dict):
+    """
+    The metric row. Re-runs on its own every 30 seconds to refresh the price,
+    leaving the agent run and the chart untouched.
+    """
+    try:
+        current_price = get_current_price(snapshot["ticker"])
+    except FETCH_ERRORS as e:
+        logger.warning("Price refresh failed for %s, showing the analysis price: %s", snapshot["ticker"], e)
+        current_price = snapshot["price"]
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Ticker", snapshot["ticker"])
+    col2.metric("Current Price", f"${current_price}")
+    col3.metric("Analyst Decision", snapshot["signal"])
+
+@st.cache_resource(max_entries=32)
+def build_candlestick_fig(ticker: str, df_hash: tuple, _df: pd.DataFrame) -> go.Figure:
+    """
+    Builds the candlestick figure once per (ticker, df_hash).
+    `_df` is skipped by Streamlit's hasher, so the DataFrame itself is never walked.
+    """
+    # Raw ndarrays let Plotly's JSON encoder take its NumPy fast path instead of iterating Series.
+    # Dropping the timezone keeps x a datetime64 array rather than an object array of Timestamps.
+    fig = go.Figure(data=[go.Candlestick(
+        x=_df.index.tz_localize(None).to_numpy(),
+        open=_df['Open'].to_numpy(),
+        high=_df['High'].to_numpy(),
+        low=_df['Low'].to_numpy(),
+        close=_df['Close'].to_numpy()
+    )])
+    fig.update_layout(
+        xaxis_rangeslider_visible=False,
+        template="plotly_dark",
+        height=500,
+        margin=dict(l=0, r=0, t=0, b=0)
+    )
+    return fig
+
 # --- 2. SIDEBAR ---
 with st.sidebar:
     st.header("Trade Settings")
-    ticker = st.text_input("Ticker Symbol", value="NVDA").upper()
+    ticker = st.text_input("Ticker Symbol", value="NVDA").upper().strip()
     max_revisions = st.number_input("Max Risk Revisions", min_value=1, max_value=5, value=2)
+    force_refresh = st.checkbox("Force refresh", value=False, help="Re-fetch data and re-run the agents instead of reusing a cached analysis")
     run_btn = st.button("Generate Analysis", type="primary")
 
 # --- 3. MAIN LOGIC ---
+# Remember the requested analysis so chart interactions (which rerun the script) keep the results on screen
 if run_btn:
+    st.session_state.analysis = (ticker, int(max_revisions))
+    if force_refresh:
+        st.session_state.results.pop(st.session_state.analysis, None)
+        run_pipeline.clear(ticker, int(max_revisions))
+        clear_market_data_cache(ticker)
+        st.session_state.pop("snapshot", None)
+
+if "analysis" in st.session_state:
+    key = st.session_state.analysis
+    ticker, max_revisions = key
     with st.spinner(f"Running autonomous agents for {ticker}..."):
         try:
             # --- EXECUTION ---
-            initial_state = {
-                "ticker": ticker, 
-                "max_revisions": max_revisions,
-                "revision_count": 0
-            }
-            final_state = app.invoke(initial_state)
+            # Same (ticker, max_revisions) as an earlier run -> reuse its final state
+            results = st.session_state.results
+            failed = st.session_state.get("failed")
+            if key in results:
+                results.move_to_end(key)
+                final_state = results[key]
+            elif failed and failed[0] == key and not run_btn:
+                # A partial run is kept apart from the LRU and reused on reruns; only the button retries it
+                final_state = failed[1]
+            else:
+                try:
+                    final_state = run_pipeline(ticker, max_revisions)
+                except PipelineError as e:
+                    final_state = e.final_state
+                    st.session_state.failed = (key, final_state)
+                else:
+                    st.session_state.pop("failed", None)
+                    results[key] = final_state
+                    if len(results) > MAX_CACHED_RESULTS:
+                        results.popitem(last=False)
             
+            if final_state.get("errors"):
+                st.error(f"⚠️ Some data sources failed: {'; '.join(final_state['errors'])}")
+
             # --- 4. PARSE DATA ---
             market_data = final_state.get("market_data", {})
             technicals = final_state.get("technicals", {})
@@ -42,35 +159,45 @@ if run_btn:
             critique = final_state.get("critique")
             
             # --- 5. DISPLAY METRICS ---
-            col1, col2, col3 = st.columns(3)
-            current_price = market_data.get("current_price", "N/A")
-            signal = technicals.get('overall_signal', {}).get('signal', 'Neutral')
-            
-            col1.metric("Ticker", ticker)
-            col2.metric("Current Price", f"${current_price}")
-            col3.metric("Analyst Decision", signal)
+            # Headline values are derived once per analysis and reused on reruns
+            snapshot = st.session_state.get("snapshot")
+            if snapshot is None or snapshot["key"] != key or final_state.get("errors"):
+                snapshot = {"key": key, **build_snapshot(ticker, final_state)}
+                st.session_state.snapshot = snapshot
+
+            price_fragment(snapshot)
 
             # --- 6. PLOTLY CHART (Optimized) ---
             st.subheader(f"{ticker} Price Action (6 Months)")
             
-            # Use .get() safely and check if it's a DataFrame
-            df = market_data.get("history_df")
+            # Served from the same 5-minute cache the data gatherer node used
+            try:
+                df = get_price_history(ticker, "6mo")
+            except FETCH_ERRORS as e:
+                st.warning(f"Price history unavailable: {e}")
+                df = None
             
             if isinstance(df, pd.DataFrame) and not df.empty:
-                fig = go.Figure(data=[go.Candlestick(
-                    x=df.index,
-                    open=df['Open'],
-                    high=df['High'],
-                    low=df['Low'],
-                    close=df['Close']
-                )])
-                fig.update_layout(
-                    xaxis_rangeslider_visible=False,
-                    template="plotly_dark",
-                    height=500,
-                    margin=dict(l=0, r=0, t=0, b=0)
-                )
-                st.plotly_chart(fig, use_container_width=True)
+                # Box-selecting on the chart zooms in: only the selected window is re-sent to the browser
+                if st.button("Reset Zoom"):
+                    st.session_state.zoom_nonce = st.session_state.get("zoom_nonce", 0) + 1
+                    st.session_state.visible_range = None
+                chart_key = f"price_chart_{ticker}_{st.session_state.get('zoom_nonce', 0)}"
+
+                boxes = st.session_state.get(chart_key, {}).get("selection", {}).get("box", [])
+                if boxes:
+                    st.session_state.visible_range = (ticker, *sorted(boxes[-1]["x"]))
+
+                visible_range = st.session_state.get("visible_range")
+                if visible_range and visible_range[0] == ticker:
+                    df_visible = df.loc[visible_range[1]:visible_range[2]]
+                    if not df_visible.empty:
+                        df = df_visible
+
+                df = downsample_ohlc(df)
+                df_hash = (df.index[0], df.index[-1], len(df), float(df['Close'].iloc[-1]))
+                fig = build_candlestick_fig(ticker, df_hash, df)
+                st.plotly_chart(fig, use_container_width=True, key=chart_key, on_select="rerun", selection_mode="box")
 
             # --- 7. TABS FOR DETAILS ---
             tab1, tab2, tab3 = st.tabs(["📝 Research Report", "📊 Fundamental Data", "🧠 Agent Logic"])
@@ -81,13 +208,13 @@ if run_btn:
             
             with tab2:
                 st.subheader("Financial Metrics")
-                metrics_list = []
-                for k, v in market_data.items():
-                    if k != "history_df": # Skip the raw dataframe
-                        metrics_list.append({"Metric": k.replace("_", " ").title(), "Value": v})
+                items = [(k, v) for k, v in market_data.items() if k != "history_df"] # Skip the raw dataframe
                 
-                if metrics_list:
-                    st.table(pd.DataFrame(metrics_list))
+                if items:
+                    st.table(pd.DataFrame({
+                        "Metric": [k.replace("_", " ").title() for k, _ in items],
+                        "Value": [v for _, v in items]
+                    }))
                 
                 st.subheader("Recent News")
                 if news:
@@ -0,0 +1,24 @@
+import numpy as np
+import pandas as pd
+
+def downsample_ohlc(df: pd.DataFrame, n_out: int = 500) -> pd.DataFrame:
+    """
+    Buckets OHLC bars down to at most n_out candles before they are sent to the browser.
+    Each bucket keeps candle semantics: first Open, max High, min Low, last Close
+    (stamped with the bucket's last date) and summed Volume.
+    """
+    if len(df) <= n_out:
+        return df
+
+    bounds = np.linspace(0, len(df), n_out + 1).astype(int)
+    starts, ends = bounds[:-1], bounds[1:] - 1
+
+    out = pd.DataFrame({
+        "Open": df["Open"].to_numpy()[starts],
+        "High": np.maximum.reduceat(df["High"].to_numpy(), starts),
+        "Low": np.minimum.reduceat(df["Low"].to_numpy(), starts),
+        "Close": df["Close"].to_numpy()[ends],
+    }, index=df.index[ends])
+    if "Volume" in df:
+        out["Volume"] = np.add.reduceat(df["Volume"].to_numpy(), starts)
+    return out
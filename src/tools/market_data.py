@@ -1,6 +1,65 @@
 import yfinance as yf
 import pandas as pd
-from typing import Dict, Any
+import logging
+import threading
+import time
+import numpy as np
+import streamlit as st
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout, wait
+from typing import Dict, Any, List
+from yfinance.data import YfData
+from yfinance.exceptions import YFException
+
+logger = logging.getLogger(__name__)
+
+QUOTE_URL = "https://query2.finance.yahoo.com/v7/finance/quote"
+QUOTE_BATCH_SIZE = 20  # Yahoo caps the symbols accepted per quote URL
+QUOTE_SUMMARY_URL = "https://query2.finance.yahoo.com/v10/finance/quoteSummary/{symbol}"
+QUOTE_SUMMARY_MODULES = "summaryDetail,defaultKeyStatistics,financialData"  # together they cover every INFO_KEYS field
+CHART_URL = "https://query1.finance.yahoo.com/v8/finance/chart/{symbol}"
+VOLATILITY_WINDOW = 30  # trading days of returns behind volatility_30d
+RETRY_STATUSES = (502, 503, 504)  # transient gateway errors worth retrying
+FETCH_TIMEOUT = 15  # seconds a single-ticker fetch waits for fundamentals and history together
+BATCH_TIMEOUT = 30  # seconds fetch_market_data_batch waits for the whole watchlist
+
+# Market cap buckets for format_market_cap_vec: thresholds, divisor and %-format template per bucket
+CAP_THRESHOLDS = np.array([1e6, 1e9, 1e12])
+CAP_DIVISORS = np.array([1.0, 1e6, 1e9, 1e12])
+CAP_FORMATS = np.array(["$%.0f", "$%.2fM", "$%.2fB", "$%.2fT"])
+
+# One HTTP session for every Yahoo call so TCP/TLS connections are reused.
+# yfinance rejects caching sessions (requests_cache), so response caching stays in st.cache_data.
+try:
+    from curl_cffi import requests as curl_requests
+    from curl_cffi.requests.exceptions import RequestException
+    _SESSION = curl_requests.Session(
+        impersonate="chrome",
+        retry=curl_requests.RetryStrategy(count=2, delay=0.3, backoff="exponential"),
+    )
+except ImportError:
+    import requests
+    from requests import RequestException
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+    _SESSION = requests.Session()
+    _SESSION.mount("https://", HTTPAdapter(
+        pool_connections=16,
+        pool_maxsize=16,
+        max_retries=Retry(total=2, backoff_factor=0.3, status_forcelist=list(RETRY_STATUSES)),
+    ))
+
+# Failures a Yahoo fetch can legitimately hit: transport/HTTP errors, yfinance errors,
+# and malformed or unexpectedly shaped JSON. Anything else is a bug and is left to propagate.
+FETCH_ERRORS = (RequestException, YFException, ValueError, KeyError, IndexError, TypeError)
+
+# Shared pool so the independent Yahoo requests overlap instead of running back to back
+_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="market_data")
+
+# In-flight fetches keyed by ticker: concurrent callers for the same symbol share one upstream fetch.
+# "hits" counts upstream fetches started, "dedupe" counts callers that piggybacked on one.
+_INFLIGHT: Dict[str, Future] = {}
+_INFLIGHT_LOCK = threading.Lock()
+INFLIGHT_STATS = {"hits": 0, "dedupe": 0}
 
 def format_market_cap(val) -> str:
     """Helper to make huge numbers readable (e.g., 2.5T, 45B)"""
@@ -14,62 +73,318 @@ def format_market_cap(val) -> str:
         return str(val)
         
     if val >= 1e12:
-        return f"${val/1e12:.2f}T"
+        return "$%.2fT" % (val / 1e12)
     elif val >= 1e9:
-        return f"${val/1e9:.2f}B"
+        return "$%.2fB" % (val / 1e9)
     elif val >= 1e6:
-        return f"${val/1e6:.2f}M"
+        return "$%.2fM" % (val / 1e6)
     else:
         return f"${val:,.0f}"
 
+def format_market_cap_vec(vals: np.ndarray) -> np.ndarray:
+    """
+    Vectorized format_market_cap for bulk fundamentals (e.g. a watchlist of market caps).
+    Buckets values with searchsorted instead of if/elif, then applies each bucket's
+    %-format template in C via np.char.mod. Values under $1M print without a thousands
+    separator. NaN lands in the unscaled bucket.
+    """
+    vals = np.asarray(vals, dtype=float)
+    idx = np.where(np.isnan(vals), 0, np.searchsorted(CAP_THRESHOLDS, vals, side="right"))
+    return np.char.mod(CAP_FORMATS[idx], vals / CAP_DIVISORS[idx])
+
+def rolling_std30(closes: np.ndarray) -> np.ndarray:
+    """
+    Latest 30-day volatility (sample std of daily returns) for every row of a
+    (n_tickers, n_days) close-price matrix, in one vectorized pass over the last 31 closes.
+    """
+    window = closes[:, -(VOLATILITY_WINDOW + 1):]
+    returns = np.diff(window, axis=1) / window[:, :-1]
+    return np.std(returns, axis=1, ddof=1)
+
+# Fundamentals spec: (market_data key, Yahoo info key, formatter). Missing/zero values become 'N/A'.
+FUNDAMENTAL_SPECS = [
+    ("market_cap", "marketCap", format_market_cap),
+    ("pe_ratio", "trailingPE", lambda v: round(v, 2)),
+    ("forward_pe", "forwardPE", lambda v: round(v, 2)),
+    ("revenue_growth", "revenueGrowth", lambda v: f"{round(v * 100, 2)}%"),
+    ("profit_margins", "profitMargins", lambda v: f"{round(v * 100, 2)}%"),
+    ("debt_to_equity", "debtToEquity", lambda v: round(v, 2)),
+    ("free_cash_flow", "freeCashflow", format_market_cap),
+    ("return_on_equity", "returnOnEquity", lambda v: f"{round(v * 100, 2)}%"),
+]
+
+# Every fundamentals key fetch_market_data reads
+INFO_KEYS = tuple(info_key for _, info_key, _ in FUNDAMENTAL_SPECS)
+
+def _get_json(url: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    GET on the shared session and decode the JSON body. 502/503/504 responses are retried
+    twice with exponential backoff (the requests fallback already does this in its adapter).
+    """
+    for attempt in range(3):
+        response = _SESSION.get(url, params=params, timeout=10)
+        if response.status_code not in RETRY_STATUSES or attempt == 2:
+            break
+        time.sleep(0.3 * 2 ** attempt)
+    response.raise_for_status()
+    return response.json()
+
+def _yahoo_quote(symbols: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Batched fundamentals from Yahoo's v7 quote endpoint, one HTTP round trip per 20 symbols.
+    YfData supplies the session cookie and crumb. Returns {symbol: raw quote dict};
+    raises on a non-200 response so callers can fall back to `.info`.
+    """
+    yf_data = YfData(session=_SESSION)
+    quotes = {}
+    for i in range(0, len(symbols), QUOTE_BATCH_SIZE):
+        batch = symbols[i:i + QUOTE_BATCH_SIZE]
+        payload = yf_data.get_raw_json(QUOTE_URL, params={"symbols": ",".join(batch), "formatted": "false"})
+        for quote in payload.get("quoteResponse", {}).get("result") or []:
+            quotes[quote["symbol"]] = quote
+    return quotes
+
+def _yahoo_quote_summary(ticker: str) -> Dict[str, Any]:
+    """
+    One quoteSummary request limited to QUOTE_SUMMARY_MODULES, instead of the omnibus
+    `.info` scrape. The modules are flattened into a dict keyed like `.info`, keeping
+    only INFO_KEYS.
+    """
+    payload = YfData(session=_SESSION).get_raw_json(
+        QUOTE_SUMMARY_URL.format(symbol=ticker),
+        params={"modules": QUOTE_SUMMARY_MODULES, "formatted": "false"},
+    )
+    info = {}
+    for module in payload["quoteSummary"]["result"][0].values():
+        for key, value in module.items():
+            if isinstance(value, dict):
+                value = value.get("raw")
+            if key in INFO_KEYS and value is not None:
+                info.setdefault(key, value)
+    return info
+
+@st.cache_data(ttl=300, show_spinner=False)
+def get_fundamentals(ticker: str) -> Dict[str, Any]:
+    """
+    Fundamentals snapshot for a ticker, memoized for 5 minutes.
+    The narrow quoteSummary request covers every field; if it fails, the v7 quote
+    endpoint still supplies market cap and the P/E ratios. If both fail the error
+    propagates, so a transient outage is never memoized.
+    """
+    try:
+        return _yahoo_quote_summary(ticker)
+    except FETCH_ERRORS as e:
+        logger.warning("quoteSummary request failed for %s: %s", ticker, e)
+
+    return _yahoo_quote([ticker])[ticker]
+
+def _fetch_history_direct(ticker: str, period: str = "6mo") -> pd.DataFrame:
+    """
+    Daily OHLCV straight from Yahoo's v8 chart endpoint (compressed JSON), skipping
+    yfinance's history() post-processing. Prices are split/dividend adjusted and dates
+    normalized to the exchange timezone, matching history(auto_adjust=True).
+    """
+    result = _get_json(CHART_URL.format(symbol=ticker), {"range": period, "interval": "1d"})["chart"]["result"][0]
+    quote = result["indicators"]["quote"][0]
+
+    index = pd.to_datetime(result["timestamp"], unit="s", utc=True)
+    index = index.tz_convert(result["meta"]["exchangeTimezoneName"]).normalize().rename("Date")
+    hist = pd.DataFrame({
+        "Open": quote["open"],
+        "High": quote["high"],
+        "Low": quote["low"],
+        "Close": quote["close"],
+        "Volume": quote["volume"],
+    }, index=index, dtype=float)
+
+    adjclose = result["indicators"].get("adjclose")
+    if adjclose:
+        adj = np.asarray(adjclose[0]["adjclose"], dtype=float)
+        ratio = adj / hist["Close"].to_numpy()
+        hist[["Open", "High", "Low"]] = hist[["Open", "High", "Low"]].mul(ratio, axis=0)
+        hist["Close"] = adj
+
+    hist = hist.dropna(subset=["Close"])
+    hist["Volume"] = hist["Volume"].fillna(0).astype("int64")
+    return hist
+
+@st.cache_data(ttl=300, show_spinner=False)
+def get_price_history(ticker: str, period: str = "6mo") -> pd.DataFrame:
+    """
+    OHLC history for a ticker, cached apart from the fundamentals dict.
+    Raises instead of returning an empty frame, so a failed fetch is never memoized.
+    """
+    try:
+        hist = _fetch_history_direct(ticker, period)
+    except FETCH_ERRORS as e:
+        logger.warning("Chart request failed for %s, falling back to yfinance history: %s", ticker, e)
+        hist = yf.Ticker(ticker, session=_SESSION).history(period=period)
+        # Nothing downstream reads these; dropping them trims the payload carried through the graph state
+        hist = hist.drop(columns=["Dividends", "Stock Splits"], errors="ignore")
+
+    if hist.empty:
+        raise ValueError(f"No price data available for ticker: {ticker}")
+    return hist
+
+@st.cache_data(ttl=30, show_spinner=False)
+def get_current_price(ticker: str) -> float:
+    """Latest traded price from the chart endpoint's metadata, cached for 30 seconds."""
+    payload = _get_json(CHART_URL.format(symbol=ticker), {"range": "1d", "interval": "1d"})
+    return round(payload["chart"]["result"][0]["meta"]["regularMarketPrice"], 2)
+
+def clear_market_data_cache(ticker: str, period: str = "6mo") -> None:
+    """Drops the cached fundamentals and price history for a ticker so the next call re-fetches."""
+    get_fundamentals.clear(ticker)
+    get_price_history.clear(ticker, period)
+
 def fetch_market_data(ticker: str) -> Dict[str, Any]:
     """
     Fetch comprehensive market data for a given stock ticker.
     Returns a dictionary with summary metrics AND the raw history dataframe.
+    Concurrent calls for the same ticker are coalesced into a single fetch.
     """
-    try:
+    ticker = ticker.upper().strip()
 
-        ticker = ticker.upper().strip()
-        stock = yf.Ticker(ticker)
+    with _INFLIGHT_LOCK:
+        future = _INFLIGHT.get(ticker)
+        is_leader = future is None
+        if is_leader:
+            future = Future()
+            _INFLIGHT[ticker] = future
+            INFLIGHT_STATS["hits"] += 1
+        else:
+            INFLIGHT_STATS["dedupe"] += 1
 
+    if is_leader:
         try:
-            info = stock.info
-        except:
-            info = {}
+            future.set_result(_fetch_market_data(ticker))
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with _INFLIGHT_LOCK:
+                _INFLIGHT.pop(ticker, None)
 
-        hist = stock.history(period="6mo")
-        
-        if hist.empty:
-            return {"error": f"No price data available for ticker: {ticker}"}
+    try:
+        result = future.result(timeout=30)
+    except FutureTimeout:
+        return {"error": f"Market data fetch timed out for ticker: {ticker}"}
 
-        current_price = hist['Close'].iloc[-1]
+    # Callers pop 'history_df' off the result, so each one gets its own dict
+    return dict(result)
 
-        if len(hist) >= 30:
-            volatility = hist['Close'].pct_change().rolling(window=30).std().iloc[-1] * 100
-        else:
-            volatility = 0.0
-
-        market_data = {
-            "ticker": ticker,
-            "current_price": round(current_price, 2),
-            "volatility_30d": round(volatility, 2) if pd.notnull(volatility) else "N/A",
-
-            "market_cap": format_market_cap(info.get('marketCap')),
-            
-            "pe_ratio": round(info.get('trailingPE', 0), 2) if info.get('trailingPE') else 'N/A',
-            "forward_pe": round(info.get('forwardPE', 0), 2) if info.get('forwardPE') else 'N/A',
-            
-            "revenue_growth": f"{round(info.get('revenueGrowth', 0) * 100, 2)}%" if info.get('revenueGrowth') else 'N/A',
-            "profit_margins": f"{round(info.get('profitMargins', 0) * 100, 2)}%" if info.get('profitMargins') else 'N/A',
-            "debt_to_equity": round(info.get('debtToEquity', 0), 2) if info.get('debtToEquity') else 'N/A',
-            
-            "free_cash_flow": format_market_cap(info.get('freeCashflow')),
-            "return_on_equity": f"{round(info.get('returnOnEquity', 0) * 100, 2)}%" if info.get('returnOnEquity') else 'N/A',
-            
-            "history_df": hist 
-        }
-        
-        return market_data
+def _fetch_market_data(ticker: str) -> Dict[str, Any]:
+    """Does the actual upstream fetch behind fetch_market_data."""
+    # Fundamentals and history are independent I/O, so fetch them concurrently
+    info_future = _EXECUTOR.submit(get_fundamentals, ticker)
+    hist_future = _EXECUTOR.submit(get_price_history, ticker, "6mo")
+    # Both waits share one deadline, so the history wait is not stacked on top of the fundamentals wait
+    deadline = time.monotonic() + FETCH_TIMEOUT
+
+    # Fundamentals are optional: the report still runs on price data alone
+    try:
+        info = info_future.result(timeout=max(0, deadline - time.monotonic()))
+    except FutureTimeout:
+        logger.warning("Fundamentals request timed out for %s", ticker)
+        info = {}
+    except FETCH_ERRORS as e:
+        logger.warning("Fundamentals request failed for %s: %s", ticker, e)
+        info = {}
 
-    except Exception as e:
+    try:
+        hist = hist_future.result(timeout=max(0, deadline - time.monotonic()))
+    except FutureTimeout:
+        return {"error": f"Price history request timed out for ticker: {ticker}"}
+    except FETCH_ERRORS as e:
+        logger.warning("Market data fetch failed for %s: %s", ticker, e)
         return {"error": f"Market data fetch failed: {str(e)}"}
+
+    # Past this point the data is in hand; any error here is a bug and propagates
+    closes = hist['Close'].to_numpy()
+    volatility = float(rolling_std30(closes[np.newaxis, :])[0] * 100) if closes.size > VOLATILITY_WINDOW else 0.0
+
+    return _build_market_data(ticker, info, hist, volatility)
+
+def _build_market_data(ticker: str, info: Dict[str, Any], hist: pd.DataFrame, volatility: float,
+                       formatted: Dict[str, str] = None) -> Dict[str, Any]:
+    """
+    Assembles the market_data dict from fetched fundamentals, history and volatility.
+    `formatted` holds fundamentals already formatted in bulk, keyed like market_data.
+    """
+    formatted = formatted or {}
+    market_data = {
+        "ticker": ticker,
+        "current_price": round(hist['Close'].iloc[-1], 2),
+        "volatility_30d": round(volatility, 2) if pd.notnull(volatility) else "N/A",
+    }
+
+    for out_key, info_key, fmt in FUNDAMENTAL_SPECS:
+        if out_key in formatted:
+            market_data[out_key] = formatted[out_key]
+            continue
+        value = info.get(info_key)
+        market_data[out_key] = fmt(value) if value else 'N/A'
+
+    market_data["history_df"] = hist
+
+    return market_data
+
+def fetch_market_data_batch(tickers: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Market data for a whole watchlist. Per-ticker history requests overlap on the shared executor
+    and 30-day volatility is computed for every ticker in a single rolling_std30 call.
+    Fundamentals come from one batched v7 quote request for the whole watchlist, which covers
+    market cap and the P/E ratios; the quoteSummary-only fields report 'N/A'.
+    Returns {ticker: market_data dict (or {"error": ...}) shaped like fetch_market_data}.
+    """
+    tickers = list(dict.fromkeys(t.upper().strip() for t in tickers))
+    quote_future = _EXECUTOR.submit(_yahoo_quote, tickers)
+    hist_futures = {t: _EXECUTOR.submit(get_price_history, t, "6mo") for t in tickers}
+
+    # One deadline for the whole batch; whatever has not finished by then counts as timed out
+    _, pending = wait([quote_future, *hist_futures.values()], timeout=BATCH_TIMEOUT)
+    for future in pending:
+        future.cancel()
+
+    results, histories = {}, {}
+    for t in tickers:
+        if hist_futures[t] in pending:
+            results[t] = {"error": f"Price history request timed out for ticker: {t}"}
+            continue
+        try:
+            histories[t] = hist_futures[t].result()
+        except FETCH_ERRORS as e:
+            logger.warning("Market data fetch failed for %s: %s", t, e)
+            results[t] = {"error": f"Market data fetch failed: {str(e)}"}
+
+    # Tickers with enough history share one (n_tickers, 31) close matrix; the rest report 0.0 like the single path
+    eligible = [t for t, hist in histories.items() if len(hist) > VOLATILITY_WINDOW]
+    volatilities = {}
+    if eligible:
+        closes = np.stack([histories[t]['Close'].to_numpy()[-(VOLATILITY_WINDOW + 1):] for t in eligible])
+        volatilities = dict(zip(eligible, rolling_std30(closes) * 100))
+
+    quotes = {}
+    if quote_future in pending:
+        logger.warning("Quote request timed out for %s", ", ".join(tickers))
+    else:
+        try:
+            quotes = quote_future.result()
+        except FETCH_ERRORS as e:
+            logger.warning("Quote request failed for %s: %s", ", ".join(tickers), e)
+    infos = {t: quotes.get(t, {}) for t in histories}
+
+    # Dollar amounts (market cap, free cash flow) are formatted for the whole watchlist in one call per field
+    formatted = {t: {} for t in histories}
+    for out_key, info_key, fmt in FUNDAMENTAL_SPECS:
+        if fmt is not format_market_cap or not histories:
+            continue
+        values = [infos[t].get(info_key) for t in histories]
+        strings = format_market_cap_vec(np.array([v if v else np.nan for v in values], dtype=float))
+        for t, value, string in zip(histories, values, strings):
+            formatted[t][out_key] = str(string) if value else 'N/A'
+
+    for t, hist in histories.items():
+        results[t] = _build_market_data(t, infos[t], hist, float(volatilities.get(t, 0.0)), formatted[t])
+
+    return {t: results[t] for t in tickers}
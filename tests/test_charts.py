@@ -0,0 +1,52 @@
+import sys
+import os
+
+# Fix path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+import pandas as pd
+from src.tools.charts import downsample_ohlc
+
+def make_ohlc(n: int) -> pd.DataFrame:
+    rng = np.random.default_rng(3)
+    close = 100 + rng.standard_normal(n).cumsum()
+    return pd.DataFrame({
+        "Open": close + rng.normal(0, 0.5, n),
+        "High": close + rng.uniform(0.5, 2, n),
+        "Low": close - rng.uniform(0.5, 2, n),
+        "Close": close,
+        "Volume": rng.integers(1_000, 10_000, n),
+    }, index=pd.date_range("2024-01-01", periods=n, name="Date"))
+
+def test_downsample_ohlc_bucket_semantics():
+    print("--- STARTING OHLC DOWNSAMPLE TEST ---")
+
+    df = make_ohlc(1000)
+    out = downsample_ohlc(df, n_out=300)
+    assert len(out) == 300
+
+    bounds = np.linspace(0, len(df), 301).astype(int)
+    for i, (start, end) in enumerate(zip(bounds[:-1], bounds[1:])):
+        bucket = df.iloc[start:end]
+        row = out.iloc[i]
+        assert row["Open"] == bucket["Open"].iloc[0]
+        assert row["High"] == bucket["High"].max()
+        assert row["Low"] == bucket["Low"].min()
+        assert row["Close"] == bucket["Close"].iloc[-1]
+        assert row["Volume"] == bucket["Volume"].sum()
+        assert out.index[i] == bucket.index[-1]
+
+    # Buckets tile the input, so the totals and the endpoints survive
+    assert out["Volume"].sum() == df["Volume"].sum()
+    assert out.index[-1] == df.index[-1]
+    print(f"   {len(df)} bars -> {len(out)} candles")
+
+def test_downsample_ohlc_passthrough():
+    df = make_ohlc(120)
+    assert downsample_ohlc(df, n_out=120) is df
+    assert downsample_ohlc(df) is df
+
+if __name__ == "__main__":
+    test_downsample_ohlc_bucket_semantics()
+    test_downsample_ohlc_passthrough()
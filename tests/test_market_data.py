@@ -0,0 +1,345 @@
+import sys
+import os
+
+# Fix path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import threading
+import time
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+import src.tools.market_data as market_data
+from src.tools.market_data import format_market_cap, format_market_cap_vec, rolling_std30
+
+def test_format_market_cap_vec_matches_scalar():
+    print("--- STARTING MARKET CAP FORMAT TEST ---")
+
+    # Every value here is >= $1M, where both formatters share the same output
+    values = [2.5e12, 1e12, 999.99e9, 45.678e9, 1e9, 3.2e6, 1e6]
+    vectorized = format_market_cap_vec(np.array(values))
+
+    for val, formatted in zip(values, vectorized):
+        print(f"   {val:>20,.0f} -> {formatted}")
+        assert formatted == format_market_cap(val)
+
+def test_format_market_cap_vec_small_values():
+    vectorized = format_market_cap_vec(np.array([999_999.0, 1234.5, np.nan]))
+    assert list(vectorized) == ["$999999", "$1234", "$nan"]
+
+def test_format_market_cap_vec_scalar_input():
+    assert format_market_cap_vec(5e9) == "$5.00B"
+    assert format_market_cap_vec(np.nan) == "$nan"
+
+def test_rolling_std30_matches_pandas():
+    print("--- STARTING 30-DAY VOLATILITY TEST ---")
+
+    rng = np.random.default_rng(7)
+    closes = 100 * np.cumprod(1 + rng.normal(0, 0.02, size=(4, 126)), axis=1)
+    vectorized = rolling_std30(closes)
+
+    for row, vol in zip(closes, vectorized):
+        expected = pd.Series(row).pct_change().rolling(window=30).std().iloc[-1]
+        print(f"   vectorized={vol:.6f} pandas={expected:.6f}")
+        assert np.isclose(vol, expected)
+
+def test_fetch_market_data_coalesces_concurrent_calls():
+    print("--- STARTING IN-FLIGHT COALESCING TEST ---")
+
+    calls = []
+    def slow_fetch(ticker):
+        calls.append(ticker)
+        time.sleep(0.3)
+        return {"ticker": ticker, "current_price": 100.0}
+
+    n_callers = 5
+    barrier = threading.Barrier(n_callers)
+    results = [None] * n_callers
+    def caller(i):
+        barrier.wait()
+        results[i] = market_data.fetch_market_data(" nvda " if i % 2 else "NVDA")
+
+    market_data.INFLIGHT_STATS.update(hits=0, dedupe=0)
+    with patch.object(market_data, "_fetch_market_data", slow_fetch):
+        threads = [threading.Thread(target=caller, args=(i,)) for i in range(n_callers)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    print(f"   upstream calls={calls} stats={market_data.INFLIGHT_STATS}")
+    assert calls == ["NVDA"]
+    assert market_data.INFLIGHT_STATS == {"hits": 1, "dedupe": n_callers - 1}
+    assert market_data._INFLIGHT == {}
+    assert all(r == {"ticker": "NVDA", "current_price": 100.0} for r in results)
+    # Every caller gets its own copy to pop 'history_df' from
+    assert len({id(r) for r in results}) == n_callers
+
+class FakeResponse:
+    def __init__(self, payload, status_code=200):
+        self.payload = payload
+        self.status_code = status_code
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.payload
+
+class FakeSession:
+    """Stands in for market_data._SESSION, serving one canned JSON payload."""
+    def __init__(self, payload):
+        self.payload = payload
+        self.requests = []
+
+    def get(self, url, params=None, timeout=None):
+        self.requests.append((url, params))
+        return FakeResponse(self.payload)
+
+def test_fetch_market_data_shares_one_deadline():
+    print("--- STARTING SINGLE-TICKER DEADLINE TEST ---")
+
+    release = threading.Event()
+    def hung(*args):
+        release.wait(5)
+        return {}
+
+    try:
+        with patch.object(market_data, "get_fundamentals", hung), \
+             patch.object(market_data, "get_price_history", hung), \
+             patch.object(market_data, "FETCH_TIMEOUT", 0.5):
+            start = time.monotonic()
+            result = market_data._fetch_market_data("NVDA")
+            elapsed = time.monotonic() - start
+    finally:
+        release.set()
+
+    print(f"   {result} after {elapsed:.2f}s")
+    assert result == {"error": "Price history request timed out for ticker: NVDA"}
+    # Back-to-back timeouts would take twice the deadline
+    assert elapsed < 0.9
+
+def test_fetch_market_data_error_handling():
+    hist = pd.DataFrame({"Close": [100.0, 101.0]}, index=pd.date_range("2024-03-01", periods=2))
+    def failing_history(ticker, period="6mo"):
+        raise KeyError("chart")
+
+    # A malformed upstream response becomes an error result
+    with patch.object(market_data, "get_fundamentals", lambda ticker: {}), \
+         patch.object(market_data, "get_price_history", failing_history):
+        assert market_data._fetch_market_data("NVDA") == {"error": "Market data fetch failed: 'chart'"}
+
+    # A bug once the data is in hand is not reported as a fetch failure
+    def broken_format(value):
+        raise TypeError("bad formatter")
+
+    with patch.object(market_data, "get_fundamentals", lambda ticker: {"marketCap": 1e9}), \
+         patch.object(market_data, "get_price_history", lambda ticker, period="6mo": hist), \
+         patch.object(market_data, "FUNDAMENTAL_SPECS", [("market_cap", "marketCap", broken_format)]):
+        try:
+            market_data._fetch_market_data("NVDA")
+        except TypeError:
+            pass
+        else:
+            raise AssertionError("formatter bug was swallowed")
+
+def test_fetch_history_direct_parses_chart_payload():
+    print("--- STARTING CHART PAYLOAD TEST ---")
+
+    # 14:30 UTC is the NYSE open; the last bar sits after UTC midnight but still on the New York trading day
+    timestamps = [
+        int(pd.Timestamp(ts, tz="UTC").timestamp())
+        for ts in ["2024-03-01 14:30", "2024-03-04 14:30", "2024-03-05 14:30", "2024-03-07 01:00"]
+    ]
+    payload = {"chart": {"result": [{
+        "meta": {"exchangeTimezoneName": "America/New_York"},
+        "timestamp": timestamps,
+        "indicators": {
+            "quote": [{
+                "open": [10.0, 20.0, None, 40.0],
+                "high": [12.0, 22.0, None, 44.0],
+                "low": [9.0, 18.0, None, 38.0],
+                "close": [11.0, 20.0, None, 42.0],
+                "volume": [1000, None, None, 4000],
+            }],
+            # Earlier bars carry a dividend adjustment, the latest is unadjusted
+            "adjclose": [{"adjclose": [5.5, 15.0, None, 42.0]}],
+        },
+    }]}}
+
+    session = FakeSession(payload)
+    with patch.object(market_data, "_SESSION", session):
+        hist = market_data._fetch_history_direct("NVDA", "6mo")
+
+    print(hist)
+    assert session.requests[0][1] == {"range": "6mo", "interval": "1d"}
+
+    # The bar with no close is dropped, the rest are stamped with their New York trading date
+    assert list(hist.index) == list(pd.DatetimeIndex(["2024-03-01", "2024-03-04", "2024-03-06"], tz="America/New_York"))
+    assert hist.index.name == "Date"
+
+    # OHLC is rescaled by adjclose / close, so the first bar is halved and the last is untouched
+    assert np.allclose(hist["Close"], [5.5, 15.0, 42.0])
+    assert np.allclose(hist["Open"], [5.0, 15.0, 40.0])
+    assert np.allclose(hist["High"], [6.0, 16.5, 44.0])
+    assert np.allclose(hist["Low"], [4.5, 13.5, 38.0])
+
+    assert hist["Volume"].dtype == np.int64
+    assert list(hist["Volume"]) == [1000, 0, 4000]
+
+def test_fetch_market_data_batch():
+    print("--- STARTING BATCH MARKET DATA TEST ---")
+
+    rng = np.random.default_rng(11)
+    index = pd.date_range("2024-01-01", periods=126, name="Date")
+    histories = {}
+    for symbol in ["AAPL", "MSFT"]:
+        close = 100 * np.cumprod(1 + rng.normal(0, 0.02, 126))
+        histories[symbol] = pd.DataFrame({"Open": close, "High": close, "Low": close, "Close": close, "Volume": 1000}, index=index)
+    histories["NEW"] = histories["AAPL"].iloc[-10:]  # too short for volatility
+
+    release = threading.Event()
+    def fake_history(ticker, period="6mo"):
+        if ticker == "HUNG":
+            release.wait(5)
+        if ticker == "BAD":
+            raise ValueError(f"No price data available for ticker: {ticker}")
+        return histories[ticker]
+
+    quote_calls = []
+    def fake_quote(symbols):
+        quote_calls.append(symbols)
+        time.sleep(0.1)
+        # MSFT is missing from the response
+        return {
+            "AAPL": {"symbol": "AAPL", "marketCap": 3e12, "trailingPE": 31.456, "forwardPE": 28.0},
+            "NEW": {"symbol": "NEW", "marketCap": 850e6},
+        }
+
+    try:
+        with patch.object(market_data, "get_price_history", fake_history), \
+             patch.object(market_data, "_yahoo_quote", fake_quote), \
+             patch.object(market_data, "BATCH_TIMEOUT", 1.5):
+            results = market_data.fetch_market_data_batch(["msft", "AAPL", " aapl", "NEW", "BAD", "HUNG"])
+    finally:
+        release.set()
+
+    for symbol, data in results.items():
+        print(f"   {symbol}: {({k: v for k, v in data.items() if k != 'history_df'})}")
+
+    # The whole watchlist shares one quote request for its fundamentals
+    assert quote_calls == [["MSFT", "AAPL", "NEW", "BAD", "HUNG"]]
+
+    assert list(results) == ["MSFT", "AAPL", "NEW", "BAD", "HUNG"]
+    assert results["AAPL"]["market_cap"] == "$3.00T"
+    assert results["AAPL"]["pe_ratio"] == 31.46
+    assert results["AAPL"]["forward_pe"] == 28.0
+    assert results["AAPL"]["free_cash_flow"] == "N/A"
+    assert results["NEW"]["market_cap"] == "$850.00M"
+    assert results["AAPL"]["volatility_30d"] == round(float(rolling_std30(histories["AAPL"]["Close"].to_numpy()[np.newaxis, :])[0] * 100), 2)
+    assert results["AAPL"]["history_df"] is histories["AAPL"]
+
+    # Missing fundamentals degrade to N/A without failing the ticker
+    assert results["MSFT"]["market_cap"] == "N/A"
+    assert results["MSFT"]["current_price"] == round(histories["MSFT"]["Close"].iloc[-1], 2)
+    assert results["NEW"]["volatility_30d"] == 0.0
+
+    assert results["BAD"] == {"error": "Market data fetch failed: No price data available for ticker: BAD"}
+    assert results["HUNG"] == {"error": "Price history request timed out for ticker: HUNG"}
+
+def test_fetch_market_data_batch_quote_failure():
+    hist = pd.DataFrame({"Close": [100.0, 101.0]}, index=pd.date_range("2024-03-01", periods=2))
+    def failing_quote(symbols):
+        raise ValueError("Expecting value: line 1 column 1 (char 0)")
+
+    with patch.object(market_data, "get_price_history", lambda ticker, period="6mo": hist), \
+         patch.object(market_data, "_yahoo_quote", failing_quote):
+        results = market_data.fetch_market_data_batch(["AAPL", "MSFT"])
+
+    for symbol in ["AAPL", "MSFT"]:
+        assert results[symbol]["current_price"] == 101.0
+        assert results[symbol]["market_cap"] == "N/A"
+        assert results[symbol]["pe_ratio"] == "N/A"
+
+def test_yahoo_quote_summary_flattens_modules():
+    print("--- STARTING QUOTE SUMMARY TEST ---")
+
+    payload = {"quoteSummary": {"result": [{
+        "summaryDetail": {
+            "maxAge": 1,
+            "marketCap": {"raw": 2_950_000_000_000, "fmt": "2.95T"},
+            "trailingPE": {"raw": 31.456, "fmt": "31.46"},
+            "forwardPE": {"raw": 28.004, "fmt": "28.00"},
+            "dividendYield": {"raw": 0.0051, "fmt": "0.51%"},
+        },
+        "defaultKeyStatistics": {
+            # Already set by summaryDetail: the first module to supply a key wins
+            "forwardPE": {"raw": 99.0, "fmt": "99.00"},
+            "profitMargins": {"raw": 0.2531, "fmt": "25.31%"},
+            "enterpriseValue": {"raw": 3e12, "fmt": "3T"},
+        },
+        "financialData": {
+            "revenueGrowth": {"raw": 0.0612, "fmt": "6.12%"},
+            "profitMargins": {"raw": 0.5, "fmt": "50.00%"},
+            "debtToEquity": 145.236,
+            # An empty {} means Yahoo has no value; it must not block the key or leak into the output
+            "freeCashflow": {},
+            "returnOnEquity": {"raw": 1.4725, "fmt": "147.25%"},
+            "currentPrice": {"raw": 190.5, "fmt": "190.50"},
+        },
+    }]}}
+
+    requests = []
+    class FakeYfData:
+        def __init__(self, session=None):
+            pass
+
+        def get_raw_json(self, url, params=None):
+            requests.append((url, params))
+            return payload
+
+    with patch.object(market_data, "YfData", FakeYfData):
+        info = market_data._yahoo_quote_summary("AAPL")
+
+    print(f"   {info}")
+    assert requests == [(market_data.QUOTE_SUMMARY_URL.format(symbol="AAPL"),
+                         {"modules": market_data.QUOTE_SUMMARY_MODULES, "formatted": "false"})]
+    assert info == {
+        "marketCap": 2_950_000_000_000,
+        "trailingPE": 31.456,
+        "forwardPE": 28.004,
+        "profitMargins": 0.2531,
+        "revenueGrowth": 0.0612,
+        "debtToEquity": 145.236,
+        "returnOnEquity": 1.4725,
+    }
+    assert set(info) <= set(market_data.INFO_KEYS)
+
+    # The flattened dict drives the same FUNDAMENTAL_SPECS formatting as `.info` did
+    hist = pd.DataFrame({"Close": [189.0, 190.456]}, index=pd.date_range("2024-03-01", periods=2))
+    data = market_data._build_market_data("AAPL", info, hist, 1.234)
+    assert list(data) == ["ticker", "current_price", "volatility_30d"] + [key for key, _, _ in market_data.FUNDAMENTAL_SPECS] + ["history_df"]
+    assert data["current_price"] == 190.46
+    assert data["volatility_30d"] == 1.23
+    assert data["market_cap"] == "$2.95T"
+    assert data["pe_ratio"] == 31.46
+    assert data["forward_pe"] == 28.0
+    assert data["revenue_growth"] == "6.12%"
+    assert data["profit_margins"] == "25.31%"
+    assert data["debt_to_equity"] == 145.24
+    assert data["free_cash_flow"] == "N/A"
+    assert data["return_on_equity"] == "147.25%"
+
+if __name__ == "__main__":
+    test_format_market_cap_vec_matches_scalar()
+    test_format_market_cap_vec_small_values()
+    test_format_market_cap_vec_scalar_input()
+    test_rolling_std30_matches_pandas()
+    test_fetch_market_data_coalesces_concurrent_calls()
+    test_fetch_market_data_shares_one_deadline()
+    test_fetch_market_data_error_handling()
+    test_fetch_history_direct_parses_chart_payload()
+    test_fetch_market_data_batch()
+    test_fetch_market_data_batch_quote_failure()
+    test_yahoo_quote_summary_flattens_modules()